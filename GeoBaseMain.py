@@ -5,8 +5,9 @@
 This module is a launcher for the GeoBases package.
 """
 
-from sys import stdin, stderr, argv
+from sys import stdin, stdout, stderr, argv
 import os
+import logging
 import os.path as op
 
 from math import ceil, log
@@ -2220,6 +2221,14 @@ def main():
     # Necessary for Windows CMD
     colorama.init()
 
+    # Verbose messages when handling data sources
+    log_handler = logging.StreamHandler(stdout)
+    log_handler.setFormatter(logging.Formatter('%(message)s'))
+
+    sources_log = logging.getLogger('GeoBases')
+    sources_log.addHandler(log_handler)
+    sources_log.setLevel(logging.INFO)
+
     #
     # COMMAND LINE MANAGEMENT
     args = handle_args()
@@ -25,15 +25,47 @@ from __future__ import with_statement
 
 import os
 import os.path as op
+import re
+import hashlib
+import atexit
+import logging
+from stat import S_ISREG
+from contextlib import contextmanager
+from collections import defaultdict
+from bisect import insort
+from threading import Lock, current_thread
+from multiprocessing.pool import ThreadPool
 from textwrap import dedent
-from urllib import urlretrieve
-from zipfile import ZipFile
+from urllib2 import build_opener, Request, HTTPError, URLError
+from httplib import HTTPException
+from email.utils import formatdate
+from zipfile import ZipFile, BadZipfile
 import shutil
 from shutil import copy, rmtree
 
+try:
+    import cPickle as pickle
+except ImportError:
+    import pickle
+
 # Not in standard library
 import yaml
 
+try:
+    # libyaml bindings are much faster, but may not be available
+    from yaml import CSafeLoader as YamlLoader, CSafeDumper as YamlDumper
+except ImportError:
+    from yaml import SafeLoader as YamlLoader, SafeDumper as YamlDumper
+
+try:
+    from os import scandir
+except ImportError:
+    try:
+        # Backport for older Python versions
+        from scandir import scandir
+    except ImportError:
+        scandir = None
+
 # Relative paths handling
 DIRNAME = op.dirname(__file__)
 
@@ -70,9 +102,54 @@ if not op.isdir(CACHE_DIR):
 if not op.isdir(COMPLETION_TARGET_DIR):
     os.makedirs(COMPLETION_TARGET_DIR)
 
+try:
+    from logging import NullHandler
+except ImportError:
+    class NullHandler(logging.Handler):
+        """Handler doing nothing, for Python < 2.7.
+        """
+        def emit(self, record):
+            pass
+
+# Verbose messages when handling files, applications configure handlers
+log = logging.getLogger(__name__)
+log.addHandler(NullHandler())
+
 # Poorly documented paths are relative from the sources dir
 DEFAULT_IS_RELATIVE = True
 
+# Downloads share the same opener, and are streamed to disk
+OPENER = build_opener()
+DOWNLOAD_TIMEOUT = 10
+DOWNLOAD_BUFFER  = 1 << 20
+
+# Archive members are streamed to disk, the most
+# recently used archives are kept open
+EXTRACT_BUFFER     = 1 << 16
+ZIP_HANDLES_SIZE   = 16
+_ZIP_HANDLES       = {}
+_ZIP_HANDLES_ORDER = []
+_ZIP_HANDLES_LOCK  = Lock()
+
+# Sources are handled in parallel, extractions from the
+# same archive are serialized
+HANDLE_WORKERS      = 8
+_ARCHIVE_LOCKS      = defaultdict(Lock)
+_ARCHIVE_LOCKS_LOCK = Lock()
+
+# Content hashing of cached files
+HASH_BUFFER = 1 << 20
+
+# Stat results and directory listings cached during an operation
+_STAT_CACHE       = {}
+_DIR_INDEX        = {}
+_STAT_CACHE_USERS = [0]
+_STAT_CACHE_LOCK  = Lock()
+
+# Status formatting
+STATUS_ROW = '%-20s | %-25s | %s\n'
+STATUS_SEP = '-' * 80
+
 # We only export the main class
 __all__ = ['SourcesManager', 'is_remote', 'is_archive']
 
@@ -107,9 +184,14 @@ class SourcesManager(object):
                 # We will use the origin file
                 self.sources_conf_path = self.sources_conf_path_origin
 
+        # Parsed configuration is pickled here to speed up loading
+        self.sources_pickle_path = op.join(cache_dir,
+                                           op.basename(self.sources_conf_path_origin) + '.pkl')
 
-        # Root folder where we find data
-        self.sources_dir = sources_dir
+        # Root folder where we find data, real path is cached
+        self._sources_dir      = None
+        self._sources_dir_real = None
+        self.sources_dir       = sources_dir
 
         # Cache directory
         self.cache_dir = cache_dir
@@ -117,17 +199,84 @@ class SourcesManager(object):
         # Maintenance script
         self.update_script_path = update_script_path
 
-        # Loading data
+        # Loading data, mutations are counted to invalidate
+        # what we compute from sources, like the status
         self.sources = None
+        self._sorted_sources = []
+        self._mutations = 0
+        self._status_cache = None, None
         self.load()
 
 
 
+    @property
+    def sources_dir(self):
+        """Root folder where we find data.
+        """
+        return self._sources_dir
+
+
+    @sources_dir.setter
+    def sources_dir(self, sources_dir):
+        """Set root folder, and refresh its real path.
+        """
+        self._sources_dir      = sources_dir
+        self._sources_dir_real = op.realpath(sources_dir)
+
+
     def load(self):
         """Load configuration file.
+
+        >>> import tempfile
+        >>> tmp_dir = tempfile.mkdtemp()
+        >>> empty_conf = op.join(tmp_dir, 'Empty.yaml')
+        >>> open(empty_conf, 'w').close()
+        >>> cache_dir = op.join(tmp_dir, 'cache')
+        >>> os.mkdir(cache_dir)
+
+        The second time, the configuration is loaded from the pickle.
+
+        >>> SourcesManager(empty_conf, cache_dir=cache_dir)._sorted_sources
+        []
+        >>> SourcesManager(empty_conf, cache_dir=cache_dir)._sorted_sources
+        []
+        >>> rmtree(tmp_dir)
         """
+        # Pickled configuration is used if the file was not modified since
+        stat = os.stat(self.sources_conf_path)
+        key  = self.sources_conf_path, stat.st_mtime, stat.st_size
+
+        try:
+            with open(self.sources_pickle_path, 'rb') as fl:
+                pickled_key, sources = pickle.load(fl)
+        except (IOError, EOFError, ValueError, TypeError, pickle.UnpicklingError):
+            pickled_key, sources = None, None
+
+        self._mutations += 1
+
+        if pickled_key == key:
+            self.sources = sources
+            self._sorted_sources = sorted(self.sources or ())
+            return
+
         with open(self.sources_conf_path) as fl:
-            self.sources = yaml.load(fl)
+            self.sources = yaml.load(fl, Loader=YamlLoader)
+
+        # Empty configuration files are loaded as None
+        self._sorted_sources = sorted(self.sources or ())
+
+        # Other processes may read it, so we move it atomically
+        tmp_path = part_filename(self.sources_pickle_path)
+
+        try:
+            with open(tmp_path, 'wb') as fl:
+                pickle.dump((key, self.sources), fl, pickle.HIGHEST_PROTOCOL)
+
+            os.rename(tmp_path, self.sources_pickle_path)
+
+        except (IOError, OSError):
+            if op.isfile(tmp_path):
+                os.remove(tmp_path)
 
 
     def __contains__(self, source):
@@ -207,6 +356,9 @@ class SourcesManager(object):
         else:
             self.sources[source] = config
 
+        insort(self._sorted_sources, source)
+        self._mutations += 1
+
 
 
     def copy_to_cache(self, path, source):
@@ -235,12 +387,16 @@ class SourcesManager(object):
         """
         if source is None:
             self.sources = {}
+            self._sorted_sources = []
+            self._mutations += 1
 
         if source not in self.sources:
             print 'Source "%s" does not exist.' % source
             return
 
         del self.sources[source]
+        self._sorted_sources.remove(source)
+        self._mutations += 1
 
 
     def update(self, source, config):
@@ -256,14 +412,17 @@ class SourcesManager(object):
         for option, option_config in config.iteritems():
             self.sources[source][option] = option_config
 
+        self._mutations += 1
+
 
     @staticmethod
     def convert(obj):
         """YAML formatting.
         """
-        return yaml.safe_dump(obj,
-                              indent=4,
-                              default_flow_style=False)
+        return yaml.dump(obj,
+                         Dumper=YamlDumper,
+                         indent=4,
+                         default_flow_style=False)
 
 
     def full_status(self, source=None):
@@ -314,9 +473,42 @@ class SourcesManager(object):
 
     def build_status(self, source=None):
         """Display informations on available sources.
+
+        Status is computed again only after sources were changed.
+
+        >>> manager = SourcesManager()
+        >>> status = manager.build_status()
+        >>> manager.build_status() is status
+        True
+        >>> manager.add('new_source', {'paths': 'new_source.csv'})
+        >>> 'new_source' in manager.build_status()
+        True
+        >>> manager.drop('new_source')
+        >>> 'new_source' in manager.build_status()
+        False
+        """
+        # Status is computed again only if sources were changed
+        key = (source,
+               id(self.sources),
+               len(self.sources),
+               self._mutations,
+               self.sources_dir,
+               self.sources_conf_path)
+
+        cached_key, status = self._status_cache
+
+        if cached_key != key:
+            status = self._build_status(source)
+            self._status_cache = key, status
+
+        return status
+
+
+    def _build_status(self, source):
+        """Build informations on available sources.
         """
         if source is None:
-            displayed = sorted(self.sources)
+            displayed = self._sorted_sources
         else:
             if source not in self.sources:
                 return 'Source "%s" not in sources.' % source
@@ -345,9 +537,9 @@ class SourcesManager(object):
         * Configuration from %s
         ''' % (self.sources_dir, self.sources_conf_path))]
 
-        tip.append('-' * 80)
-        tip.append('%-20s | %-25s | %s' % ('NAME', 'KEY', 'PATHS (DEFAULT + FAILOVERS)'))
-        tip.append('-' * 80)
+        tip.append('\n%s\n' % STATUS_SEP)
+        tip.append(STATUS_ROW % ('NAME', 'KEY', 'PATHS (DEFAULT + FAILOVERS)'))
+        tip.append('%s\n' % STATUS_SEP)
 
         for source in displayed:
             config = self.sources[source]
@@ -360,18 +552,15 @@ class SourcesManager(object):
             else:
                 keys, paths = missing, missing
 
-            if isinstance(paths, (str, dict)):
-                paths = [paths]
-            tip.append('%-20s | %-25s | %s' % \
-                       (source, fmt_keys(keys), '.) %s' % fmt_path(paths[0])))
-
-            for n, path in enumerate(paths[1:], start=1):
-                tip.append('%-20s | %-25s | %s' % \
-                           ('-', '-', '%s) %s' % (n, fmt_path(path))))
+            for n, path in enumerate(yield_paths(paths)):
+                if n == 0:
+                    tip.append(STATUS_ROW % (source, fmt_keys(keys), '.) %s' % fmt_path(path)))
+                else:
+                    tip.append(STATUS_ROW % ('-', '-', '%s) %s' % (n, fmt_path(path))))
 
-        tip.append('-' * 80)
+        tip.append(STATUS_SEP)
 
-        return '\n'.join(tip)
+        return ''.join(tip)
 
 
     def help_permanent_add(self, options):
@@ -413,163 +602,645 @@ class SourcesManager(object):
         Handle file downloading/uncompressing and returns
         path to file to be opened.
         """
-        full_cache_dir = op.join(self.cache_dir, source)
+        with caching_stats():
+            full_cache_dir = op.join(self.cache_dir, source)
 
-        if not op.isdir(full_cache_dir):
-            os.makedirs(full_cache_dir)
+            if not op.isdir(full_cache_dir):
+                os.makedirs(full_cache_dir)
 
-        if not is_remote(path):
-            if path['local'] is True:
-                file_ = op.join(op.realpath(self.sources_dir), path['file'])
+            if not is_remote(path):
+                if path['local'] is True:
+                    file_ = op.join(self._sources_dir_real, path['file'])
+                else:
+                    file_ = path['file']
             else:
-                file_ = path['file']
-        else:
-            file_, success = download_lazy(path['file'], full_cache_dir, verbose)
+                file_, success = download_lazy(path['file'], full_cache_dir, verbose)
 
-            if not success:
-                if verbose:
-                    print '/!\ Failed to download "%s".' % path['file']
-                return
+                if not success:
+                    if verbose:
+                        log.info('/!\ Failed to download "%s".', path['file'])
+                    return
 
-        if is_archive(path):
-            archive = file_
-            file_, success = extract_lazy(archive, path['extract'], full_cache_dir, verbose)
+            if is_archive(path):
+                archive = file_
+                file_, success = extract_lazy(archive, path['extract'], full_cache_dir, verbose)
 
-            if not success:
-                if verbose:
-                    print '/!\ Failed to extract "%s" from "%s".' % \
-                            (path['extract'], archive)
+                if not success:
+                    if verbose:
+                        log.info('/!\ Failed to extract "%s" from "%s".',
+                                 path['extract'], archive)
+                    return
+
+            return file_
+
+
+    def handle_all(self, sources=None, verbose=True):
+        """
+        Handle file downloading/uncompressing for several sources
+        in parallel, and returns a dict with the path to the file
+        to be opened for each source (None if all paths failed).
+
+        >>> manager = SourcesManager()
+        >>> files = manager.handle_all(['capitals', 'continents'], verbose=False)
+        >>> sorted(files)
+        ['capitals', 'continents']
+        >>> files['capitals']
+        '/.../DataSources/Countries/capitals.csv'
+        """
+        if sources is None:
+            sources = list(self._sorted_sources)
+
+        def handle(source):
+            """Try all paths of a source, until one succeeds."""
+            config = self.sources[source]
+
+            if config is None:
                 return
 
-        return file_
+            for path in self.convert_paths_format(config.get('paths')) or []:
+                file_ = self.handle_path(path, source, verbose)
+
+                if file_ is not None:
+                    return file_
+
+        if not sources:
+            return {}
+
+        with caching_stats():
+            pool = ThreadPool(min(HANDLE_WORKERS, len(sources)))
+            try:
+                files = pool.map(handle, sources)
+            finally:
+                pool.close()
+                pool.join()
+
+        return dict(zip(sources, files))
 
 
     @staticmethod
     def convert_paths_format(paths, default_is_relative=DEFAULT_IS_RELATIVE):
         """Convert all paths to the same format.
+
+        >>> paths = ['Countries/capitals.csv', {'file': 'http://host/FR.zip'}]
+        >>> new_paths = SourcesManager.convert_paths_format(paths)
+        >>> [p['local'] for p in new_paths]
+        [True, False]
+
+        Paths given are not modified.
+
+        >>> paths
+        ['Countries/capitals.csv', {'file': 'http://host/FR.zip'}]
         """
         if paths is None:
             return
 
-        # If paths is just *one* archive or *one* file
-        if isinstance(paths, (str, dict)):
-            paths = [paths]
-
-        # We normalize all path as a dict structure
-        new_paths = []
-
-        for path in paths:
+        def normalize(path):
+            """Copy of path as a dict structure."""
             if isinstance(path, str):
-                path = {
+                npath = {
                     'file' : path,
                 }
+            else:
+                npath = dict(path)
 
-            # We append a copy
-            new_paths.append(dict(path.items()))
-
-
-        for npath in new_paths:
             # 'local' is only used for sources from configuration
             # to have a relative path from the configuration file
-            if 'local' not in npath:
+            if _REMOTE_RE(npath['file']):
+                npath['local'] = False
+            elif 'local' not in npath:
                 npath['local'] = default_is_relative
 
-            if is_remote(npath):
-                npath['local'] = False
+            return npath
 
-        return tuple(new_paths)
+        # paths may be just *one* archive or *one* file
+        return tuple(normalize(path) for path in yield_paths(paths))
 
 
 
 
 # Remote prefix detection
-R_PREFIXES = set(['http://', 'https://'])
-has_prefix = lambda path, prefixes: any(path.lower().startswith(p) for p in prefixes)
+_REMOTE_RE = re.compile(r'^https?://', re.I).match
 
 def is_remote(path):
     """Tells if a path is remote.
+
+    >>> is_remote({'file': 'HTTP://download.geonames.org/export/dump/FR.zip'})
+    True
+    >>> is_remote({'file': 'Airlines/ori_airlines.csv'})
+    False
     """
-    return has_prefix(path['file'], R_PREFIXES)
+    return _REMOTE_RE(path['file']) is not None
 
 # Remote prefix detection
 is_archive = lambda path: 'extract' in path
 
+
+def yield_paths(paths):
+    """Iterate over paths, which may be just *one* archive or *one* file.
+    """
+    if isinstance(paths, (str, dict)):
+        yield paths
+    else:
+        for path in paths:
+            yield path
+
+
+@contextmanager
+def caching_stats():
+    """
+    Cache stat results for the duration of an operation,
+    they are forgotten when the outermost operation ends.
+    """
+    with _STAT_CACHE_LOCK:
+        _STAT_CACHE_USERS[0] += 1
+    try:
+        yield
+    finally:
+        with _STAT_CACHE_LOCK:
+            _STAT_CACHE_USERS[0] -= 1
+            if not _STAT_CACHE_USERS[0]:
+                _STAT_CACHE.clear()
+                _DIR_INDEX.clear()
+
+
+def forget_stat(path):
+    """Forget cached stat result of a file we just wrote.
+    """
+    _STAT_CACHE.pop(path, None)
+
+    index = _DIR_INDEX.get(op.dirname(path))
+
+    if index is not None:
+        index[op.basename(path)] = None
+
+
+def cached_stat(path):
+    """
+    Stat a file, reusing the result if already done during
+    the current operation. Returns None if the file does not exist.
+    """
+    if not _STAT_CACHE_USERS[0]:
+        try:
+            return os.stat(path)
+        except OSError:
+            return None
+
+    try:
+        return _STAT_CACHE[path]
+    except KeyError:
+        pass
+
+    try:
+        st = os.stat(path)
+    except OSError:
+        st = None
+
+    _STAT_CACHE[path] = st
+
+    return st
+
+
+def listed_files(directory):
+    """
+    Index of a directory, listed once during the current operation.
+    Names are mapped to True for regular files, False for other
+    entries, and None if unknown. Returns None if not available.
+    """
+    # Without scandir, listing would cost more than the stat calls saved
+    if not _STAT_CACHE_USERS[0] or scandir is None:
+        return None
+
+    try:
+        return _DIR_INDEX[directory]
+    except KeyError:
+        pass
+
+    try:
+        # File types come from the listing, without stat calls
+        index = dict((entry.name, entry.is_file()) for entry in scandir(directory))
+    except OSError:
+        index = None
+
+    _DIR_INDEX[directory] = index
+
+    return index
+
+
+def is_file(path):
+    """Same as os.path.isfile, using cached directory listings and stat results.
+    """
+    index = listed_files(op.dirname(path))
+
+    if index is not None:
+        name = op.basename(path)
+
+        if name not in index:
+            return False
+
+        if index[name] is not None:
+            return index[name]
+
+    st = cached_stat(path)
+
+    return st is not None and S_ISREG(st.st_mode)
+
+
 # Date comparisons
 def is_older(a, b):
     """Test file last modifcation time.
     """
+    st_a, st_b = cached_stat(a), cached_stat(b)
+
+    # If this fails, we say it is not older
+    if st_a is None or st_b is None:
+        return False
+
+    return st_a.st_mtime < st_b.st_mtime
+
+
+def stat_key(path):
+    """
+    Metadata of a file, if unchanged we consider
+    the content did not change either.
+    """
+    st = cached_stat(path)
+
+    if st is None:
+        return None
+
+    return '%s %r %s' % (st.st_size, st.st_mtime, st.st_ino)
+
+
+def file_digest(path):
+    """Compute the SHA-256 of a file content.
+    """
+    digest = hashlib.sha256()
+
+    with open(path, 'rb') as fl:
+        for chunk in iter(lambda: fl.read(HASH_BUFFER), ''):
+            digest.update(chunk)
+
+    return digest.hexdigest()
+
+
+def write_digest(digest_path, path, digest=None, key=None):
+    """Store digest and metadata of a file in a sidecar file.
+    """
+    if digest is None:
+        digest = file_digest(path)
+
+    if key is None:
+        key = stat_key(path)
+
+    with open(digest_path, 'w') as fl:
+        fl.write('%s %s\n' % (digest, key))
+
+    forget_stat(digest_path)
+
+
+def read_digest(digest_path):
+    """Read digest and metadata from a sidecar file.
+    """
     try:
-        if os.stat(a).st_mtime < os.stat(b).st_mtime:
-            return True
-    except OSError:
-        # If this fails, we say it is not older
+        with open(digest_path) as fl:
+            digest, _, key = fl.read().rstrip('\n').partition(' ')
+    except IOError:
+        return None, None
+
+    return digest, key
+
+
+def hash_changed(path, digest_path):
+    """
+    Tell if a file content changed since the sidecar was written.
+    Metadata are checked first, the file is hashed only if they differ.
+    """
+    digest, key = read_digest(digest_path)
+
+    if digest is None or not is_file(path):
+        return True
+
+    if stat_key(path) == key:
+        return False
+
+    if file_digest(path) == digest:
+        # Same content, we refresh metadata for next time
+        write_digest(digest_path, path, digest)
+        return False
+
+    return True
+
+
+def read_validators(path):
+    """Read HTTP cache validators stored in a sidecar file.
+    """
+    validators = {}
+
+    try:
+        with open(path) as fl:
+            for row in fl:
+                header, _, value = row.rstrip('\n').partition(': ')
+                if value:
+                    validators[header] = value
+    except IOError:
         pass
-    return False
+
+    return validators
+
+
+def write_validators(path, headers):
+    """Store HTTP cache validators in a sidecar file.
+    """
+    with open(path, 'w') as fl:
+        for header in ('ETag', 'Last-Modified'):
+            value = headers.get(header)
+            if value:
+                fl.write('%s: %s\n' % (header, value))
+
+
+def part_filename(filename):
+    """Temporary file name, unique for each process and thread.
+    """
+    return '%s.part.%s.%s' % (filename, os.getpid(), current_thread().ident)
 
 
 def download_lazy(resource, cache_dir, verbose=True):
     """
     Download a remote file only if target file is not already
-    in cache directory.
+    in cache directory, or if the remote file was modified.
     Returns boolean for success or failure, and path
     to downloaded file (may not be exactly the same as the one checked).
     """
-    # If in cache directory, we use it, otherwise we download it
+    # If in cache directory, we use it unless the server
+    # tells us it was modified, otherwise we download it
     filename_test = op.join(cache_dir, op.basename(resource))
+    meta_path     = filename_test + '.etag'
+    digest_path   = filename_test + '.sha256'
+
+    cached  = is_file(filename_test)
+    headers = {}
+
+    # If the cached file was modified locally, we download it again
+    if cached and not (is_file(digest_path) and
+                       hash_changed(filename_test, digest_path)):
+        validators = read_validators(meta_path)
+
+        if 'ETag' in validators:
+            headers['If-None-Match'] = validators['ETag']
+
+        if 'Last-Modified' in validators:
+            headers['If-Modified-Since'] = validators['Last-Modified']
+        else:
+            st = cached_stat(filename_test)
+
+            if st is not None:
+                headers['If-Modified-Since'] = formatdate(st.st_mtime, usegmt=True)
+
+    try:
+        response = OPENER.open(Request(resource, headers=headers),
+                               timeout=DOWNLOAD_TIMEOUT)
+    except (HTTPError, URLError, IOError, HTTPException) as err:
+        if not cached:
+            return None, False
 
-    if op.isfile(filename_test):
         if verbose:
-            print '/!\ Using "%s" already in cache directory for "%s"' % \
-                    (filename_test, resource)
+            if isinstance(err, HTTPError) and err.code == 304:
+                log.info('/!\ Using "%s" already in cache directory for "%s"',
+                         filename_test, resource)
+            else:
+                log.info('/!\ Could not check "%s", using "%s" already in cache directory',
+                         resource, filename_test)
         return filename_test, True
 
     if verbose:
-        print '/!\ Downloading "%s" in cache directory from "%s"' % \
-                (filename_test, resource)
+        log.info('/!\ Downloading "%s" in cache directory from "%s"',
+                 filename_test, resource)
+
+    # We stream to a temporary file, then move it atomically
+    # The content is hashed on the way
+    tmp_filename = part_filename(filename_test)
+    digest = hashlib.sha256()
+
     try:
-        dl_filename, _ = urlretrieve(resource, filename_test)
-    except IOError:
-        return None, False
-    else:
-        return dl_filename, True
+        try:
+            with open(tmp_filename, 'wb') as out:
+                for chunk in iter(lambda: response.read(DOWNLOAD_BUFFER), ''):
+                    digest.update(chunk)
+                    out.write(chunk)
+                size = out.tell()
+        finally:
+            response.close()
+
+        # Partial reads do not raise IncompleteRead on truncated responses
+        length = response.info().get('Content-Length')
+
+        if length is not None and length.isdigit() and int(length) != size:
+            raise IOError('Downloaded %s bytes instead of %s.' % (size, length))
+
+        os.rename(tmp_filename, filename_test)
+        forget_stat(filename_test)
+
+    except (IOError, OSError, HTTPException):
+        # Truncated responses raise IncompleteRead
+        if op.isfile(tmp_filename):
+            os.remove(tmp_filename)
+
+        if not cached:
+            return None, False
+        return filename_test, True
+
+    write_validators(meta_path, response.info())
+    write_digest(digest_path, filename_test, digest.hexdigest())
+
+    return filename_test, True
+
+
+def open_zip(archive):
+    """
+    Open an archive, reusing the handle previously opened if
+    the archive was not modified since.
+    Returns the stat key of the archive opened, and the handle.
+    """
+    key = stat_key(archive)
+
+    if key is None:
+        raise IOError('Archive %s does not exist.' % archive)
+
+    with _ZIP_HANDLES_LOCK:
+        if archive in _ZIP_HANDLES:
+            handle_key, zip_file = _ZIP_HANDLES.pop(archive)
+            _ZIP_HANDLES_ORDER.remove(archive)
+
+            if handle_key == key:
+                _ZIP_HANDLES[archive] = key, zip_file
+                _ZIP_HANDLES_ORDER.append(archive)
+                return key, zip_file
+
+            # Extractions from this archive are serialized
+            # so nobody else is using this handle
+            zip_file.close()
+
+        zip_file = ZipFile(archive)
+        _ZIP_HANDLES[archive] = key, zip_file
+        _ZIP_HANDLES_ORDER.append(archive)
+
+        # Least recently used handles are dropped, but not closed
+        # as another thread may still be extracting from them
+        while len(_ZIP_HANDLES_ORDER) > ZIP_HANDLES_SIZE:
+            del _ZIP_HANDLES[_ZIP_HANDLES_ORDER.pop(0)]
+
+    return key, zip_file
+
+
+def close_zips():
+    """Close all archives kept open.
+    """
+    with _ZIP_HANDLES_LOCK:
+        for _, zip_file in _ZIP_HANDLES.itervalues():
+            zip_file.close()
+
+        _ZIP_HANDLES.clear()
+        del _ZIP_HANDLES_ORDER[:]
+
+atexit.register(close_zips)
+
+
+def member_crc(archive, filename):
+    """
+    CRC-32 of a file in an archive, read from the central directory,
+    and stat key of the archive it was read from.
+    Returns None, None if it cannot be read.
+    """
+    try:
+        key, zip_file = open_zip(archive)
+        return '%08x' % zip_file.getinfo(filename).CRC, key
+    except (IOError, OSError, BadZipfile, KeyError):
+        return None, None
+
+
+def archive_lock(archive):
+    """Lock used to serialize extractions from an archive.
+    """
+    with _ARCHIVE_LOCKS_LOCK:
+        return _ARCHIVE_LOCKS[archive]
 
 
 def extract_lazy(archive, filename, cache_dir, verbose=True):
     """
     Extract a file from archive if file is not already in
     the cache directory.
+
+    >>> import tempfile
+    >>> tmp_dir = tempfile.mkdtemp()
+    >>> archive = op.join(tmp_dir, 'MC.zip')
+    >>> shutil.copy(relative('DataSources/Por/GeoNames/MC.zip'), archive)
+    >>> mtime = os.stat(archive).st_mtime
+    >>> extracted, success = extract_lazy(archive, 'MC.txt', tmp_dir, verbose=False)
+    >>> success
+    True
+    >>> inode = os.stat(extracted).st_ino
+
+    The archive is rewritten, but the file we extracted did not change.
+    Its CRC is the same, so it is not extracted again. Archives may be
+    replaced within the same second, so we keep the same modification time.
+
+    >>> zip_file = ZipFile(archive, 'a')
+    >>> zip_file.writestr('other.txt', 'other')
+    >>> zip_file.close()
+    >>> os.utime(archive, (mtime, mtime))
+    >>> extract_lazy(archive, 'MC.txt', tmp_dir, verbose=False) == (extracted, True)
+    True
+    >>> os.stat(extracted).st_ino == inode
+    True
+
+    If the file changed in the archive, it is extracted again.
+
+    >>> zip_file = ZipFile(archive, 'w')
+    >>> zip_file.writestr('MC.txt', 'new')
+    >>> zip_file.close()
+    >>> os.utime(archive, (mtime, mtime))
+    >>> extract_lazy(archive, 'MC.txt', tmp_dir, verbose=False) == (extracted, True)
+    True
+    >>> open(extracted).read()
+    'new'
+    >>> rmtree(tmp_dir)
     """
-    # Perhaps the file was already extracted here
-    # We also check the dates of modification in case
-    # the extracted file obsolete
-    filename_test = op.join(cache_dir, filename)
+    # Extractions from the same archive are serialized
+    with archive_lock(archive):
+        # Perhaps the file was already extracted here
+        # We also check the CRC of the file in the archive, or the dates
+        # of modification if unknown, in case the extracted file obsolete
+        filename_test = op.join(cache_dir, filename)
+        crc_path      = filename_test + '.crc'
+
+        if is_file(filename_test):
+            crc, key = read_digest(crc_path)
+
+            if crc is None:
+                up_to_date = is_older(archive, filename_test)
+
+            elif stat_key(archive) == key:
+                up_to_date = True
+
+            else:
+                # Archive changed, but maybe not the file we want
+                # Metadata are refreshed with those of the archive
+                # the CRC was actually read from
+                new_crc, new_key = member_crc(archive, filename)
+                up_to_date = new_crc == crc
+
+                if up_to_date:
+                    write_digest(crc_path, archive, crc, new_key)
+
+            if up_to_date:
+                if verbose:
+                    log.info('/!\ Skipping extraction for "%s", already at "%s"',
+                             filename, filename_test)
+                return filename_test, True
 
-    if op.isfile(filename_test):
-        if is_older(archive, filename_test):
             if verbose:
-                print '/!\ Skipping extraction for "%s", already at "%s"' % \
-                        (filename, filename_test)
-            return filename_test, True
+                log.info('/!\ File "%s" already at "%s", but "%s" changed, removing',
+                         filename, filename_test, archive)
 
         if verbose:
-            print '/!\ File "%s" already at "%s", but "%s" is newer, removing' % \
-                    (filename, filename_test, archive)
+            log.info('/!\ Extracting "%s" from "%s" in "%s"',
+                     filename, archive, filename_test)
 
-    if verbose:
-        print '/!\ Extracting "%s" from "%s" in "%s"' % \
-                (filename, archive, filename_test)
+        # We stream one file from the archive
+        try:
+            key, zip_file = open_zip(archive)
+            info   = zip_file.getinfo(filename)
+            member = zip_file.open(info)
+        except (IOError, OSError, BadZipfile):
+            return None, False
+        except KeyError:
+            if verbose:
+                log.info('/!\ "%s" not in "%s"', filename, archive)
+            return None, False
 
-    # We extract one file from the archive
-    try:
-        extracted = ZipFile(archive).extract(filename, op.dirname(filename_test))
-    except IOError:
-        return None, False
-    except KeyError:
-        if verbose:
-            print '/!\ "%s" not in "%s"' % (filename, archive)
-        return None, False
-    else:
-        return extracted, True
+        if not op.isdir(op.dirname(filename_test)):
+            os.makedirs(op.dirname(filename_test))
+
+        tmp_filename = part_filename(filename_test)
+
+        try:
+            try:
+                with open(tmp_filename, 'wb') as out:
+                    shutil.copyfileobj(member, out, EXTRACT_BUFFER)
+            finally:
+                member.close()
+
+            os.rename(tmp_filename, filename_test)
+            forget_stat(filename_test)
+
+        except (IOError, OSError, BadZipfile):
+            if op.isfile(tmp_filename):
+                os.remove(tmp_filename)
+            return None, False
+
+        write_digest(crc_path, archive, '%08x' % info.CRC, key)
+
+        return filename_test, True
 
 
 def is_in_path(command):
@@ -27,7 +27,9 @@ INSTALL_REQUIRES = [
 
 EXTRAS_REQUIRE = {
     # Private
-    'OpenTrep': ['OpenTrepWrapper>=0.6']
+    'OpenTrep': ['OpenTrepWrapper>=0.6'],
+    # Public - faster cache checks
+    'scandir' : ['scandir']
 }
 
 DEPENDENCY_LINKS        = []
@@ -10,6 +10,10 @@ import doctest
 
 import os
 import sys
+from tempfile import mkdtemp
+from shutil import rmtree
+from StringIO import StringIO
+from urllib2 import HTTPError, URLError
 
 # PYTHON PATH MANAGEMENT
 DIRNAME = os.path.dirname(__file__)
@@ -81,6 +85,92 @@ class GeoBaseFeedTest(unittest.TestCase):
         self.assertEqual(self.g.keys(), ['1', '2'])
 
 
+class FakeResponse(StringIO):
+    """Response with a body and some headers.
+    """
+    def __init__(self, body, headers=None):
+        StringIO.__init__(self, body)
+        self.headers = headers or {}
+
+    def info(self):
+        return self.headers
+
+
+class FakeOpener(object):
+    """Opener giving canned answers, and recording requests.
+    """
+    def __init__(self, *answers):
+        self.answers  = list(answers)
+        self.requests = []
+
+    def open(self, request, timeout=None):
+        self.requests.append(request)
+        answer = self.answers.pop(0)
+
+        if isinstance(answer, Exception):
+            raise answer
+        return answer
+
+
+class DownloadLazyTest(unittest.TestCase):
+    """This class tests the download of remote sources.
+    """
+    url = 'http://example.com/data.csv'
+
+    def setUp(self):
+        self.cache_dir = mkdtemp()
+        self.cached = os.path.join(self.cache_dir, 'data.csv')
+        self.opener = GeoS.OPENER
+
+    def tearDown(self):
+        GeoS.OPENER = self.opener
+        rmtree(self.cache_dir)
+
+    def download(self, *answers):
+        GeoS.OPENER = FakeOpener(*answers)
+        return GeoS.download_lazy(self.url, self.cache_dir, verbose=False)
+
+    def content(self):
+        with open(self.cached) as fl:
+            return fl.read()
+
+    def temporary_files(self):
+        return [f for f in os.listdir(self.cache_dir) if '.part' in f]
+
+    def test_download(self):
+        self.assertEqual(self.download(FakeResponse('a^b\n', {'ETag': '"v1"'})),
+                         (self.cached, True))
+        self.assertEqual(self.content(), 'a^b\n')
+        self.assertEqual(self.temporary_files(), [])
+
+    def test_not_modified(self):
+        self.download(FakeResponse('a^b\n', {'ETag': '"v1"'}))
+        not_modified = HTTPError(self.url, 304, 'Not Modified', {}, None)
+
+        self.assertEqual(self.download(not_modified), (self.cached, True))
+        self.assertEqual(GeoS.OPENER.requests[0].get_header('If-none-match'), '"v1"')
+        self.assertEqual(self.content(), 'a^b\n')
+
+    def test_unreachable(self):
+        self.download(FakeResponse('a^b\n'))
+
+        self.assertEqual(self.download(URLError('down')), (self.cached, True))
+        self.assertEqual(self.content(), 'a^b\n')
+
+    def test_not_found(self):
+        not_found = HTTPError(self.url, 404, 'Not Found', {}, None)
+
+        self.assertEqual(self.download(not_found), (None, False))
+        self.assertFalse(os.path.exists(self.cached))
+
+    def test_truncated(self):
+        truncated = FakeResponse('a^b\n', {'Content-Length': '100'})
+
+        self.assertEqual(self.download(truncated), (None, False))
+        self.assertFalse(os.path.exists(self.cached))
+        self.assertEqual(self.temporary_files(), [])
+
+
 def test_suite():
     """Create a test suite of all doctests.
     """
@@ -93,6 +183,7 @@ def test_suite():
     # Adding unittests
     tests.addTests(unittest.makeSuite(GeoBaseTest))
     tests.addTests(unittest.makeSuite(GeoBaseFeedTest))
+    tests.addTests(unittest.makeSuite(DownloadLazyTest))
 
     # Standard options for DocTests
     opt =  (doctest.ELLIPSIS |